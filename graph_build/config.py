@@ -1,5 +1,6 @@
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -8,6 +9,9 @@ class Config:
     index_save_path: str = "./vector_index"
     output_dir: str = "./ai_output"
     output_format: str = "neo4j"
+    log_level: str = "INFO"  # 设为 DEBUG 时输出每个菜谱的解析结果
+    cache_path: Optional[str] = None  # Kimi响应缓存，默认为 output_dir/.kimi_cache/responses.db，设为空字符串则不缓存
+    cache_ttl: int = 30 * 24 * 3600  # 缓存有效期（秒）
     api_key = os.environ.get("MOONSHOT_API_KEY")
     # 模型配置
     embedding_model: str = "BAAI/bge-small-zh-v1.5"
@@ -19,5 +23,15 @@ class Config:
 
     # 生成配置
     temperature: float = 0.1
-    max_tokens: int = 2048
+    max_tokens: int = 1200  # 首次解析的输出上限，输出被截断导致JSON无效时按 retry_max_tokens 重试
+    retry_max_tokens: int = 2048  # 严格JSON重试时的输出上限
+    max_input_tokens: int = 32000  # 单次请求输入令牌上限，超出时截断菜谱内容
+    recipes_per_request: int = 1  # 每次请求合并解析的菜谱数，短菜谱较多时可调大以减少请求数
 
+    # 限流配置（按账号的每分钟请求数/令牌数上限）
+    requests_per_minute: int = 200
+    tokens_per_minute: int = 128000
+
+    def __post_init__(self):
+        if self.cache_path is None:
+            self.cache_path = os.path.join(self.output_dir, ".kimi_cache", "responses.db")
@@ -3,533 +3,1256 @@
 """
 基于Kimi API的智能菜谱解析AI Agent
 """
-import glob
+import asyncio
+import csv
+import functools
+import hashlib
+import io
 import os
 import json
+import logging
+import random
 import re
+import shutil
+import sqlite3
+import string
+import threading
 import time
-from openai import OpenAI
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
-import pandas as pd
-import csv
-from datetime import datetime
 
-from pandas import DataFrame
+import httpx
+from openai import (APIConnectionError, APIStatusError, AsyncOpenAI, AuthenticationError, NotFoundError, OpenAI,
+                    PermissionDeniedError)
+from typing import Annotated, Dict, Iterable, List, Optional, Tuple
+from dataclasses import field
+
+from pydantic import BeforeValidator, TypeAdapter
+from pydantic.dataclasses import dataclass
+
+from graph_build.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 粗略的字符/令牌换算比例，用于预估令牌数和截断超长输入
+# 菜谱语料是中文，约 1~1.5 个字符一个令牌，按 1 估算：宁可高估，避免并发突发时超出TPM或输入上限
+CHARS_PER_TOKEN = 1
+
+# JSON解析失败时追加的约束消息，只重试一次
+_STRICT_JSON_MESSAGE = {"role": "system", "content": "STRICT JSON ONLY：只返回一个合法的JSON对象，不要包含代码块标记或任何解释文字。"}
+
+# 显式的超时设置，避免卡死的连接无限期占用并发槽位
+API_TIMEOUT = httpx.Timeout(connect=10.0, read=60.0, write=10.0, pool=5.0)
+
+# 系统提示词：提取规则和JSON格式只在这里出现一次。每次请求都以完全相同的内容放在
+# messages 首位，单个与批量解析共享，便于服务端前缀缓存命中
+SYSTEM_PROMPT = """你是一个专业的菜谱分析专家，从标准化格式的中文菜谱Markdown中提取结构化信息，只返回JSON。
+
+菜谱固定包含二级标题：必备原料和工具、计算（份量和用量）、操作（有序步骤）、附加内容（技巧，含需忽略的模板文字）。
+
+提取规则：
+1. name：一级标题"# XXX的做法"去掉"的做法"
+2. difficulty："预估烹饪难度"中★的数量（1-5）
+3. category：素菜/荤菜/水产/早餐/主食/汤类/甜品/饮料/调料，可多选，逗号分隔（如"早餐,素菜,主食"）；给出 category_hint 时使用它
+4. cuisine_type：菜系（如川菜、粤菜），不明确则为空
+5. prep_time/cook_time：从腌制切配、炒制炖煮等步骤推断；servings：从"计算"提取（如"2个人食用"）
+6. ingredients：合并"必备原料和工具"与"计算"，amount/unit 精确取自"计算"，"适量"等非数值用量也写成字符串；category 为蔬菜/调料/蛋白质/淀粉类/其他；主料 is_main 为 true，调料为 false
+7. steps：按"操作"的有序列表逐条提取；methods 如炒、炸、煮、蒸、烤、炖、焖、煎、红烧、腌制、切；tools 如炒锅、平底锅、蒸锅、刀、案板、锅铲；time_estimate 取步骤中提到的时间
+8. tags：只取"附加内容"中的烹饪技巧，忽略"Issue或Pull request"等模板文字
+
+JSON格式：
+{"name": "", "difficulty": 3, "category": "", "cuisine_type": "", "prep_time": "", "cook_time": "", "servings": "",
+"ingredients": [{"name": "", "amount": "", "unit": "", "category": "", "is_main": true}],
+"steps": [{"step_number": 1, "description": "", "methods": [], "tools": [], "time_estimate": ""}],
+"tags": [], "nutrition_info": {"calories": "", "protein": "", "carbs": "", "fat": ""}}"""
 
+# 用户消息只包含每个菜谱不同的部分
+_USER_PROMPT_TMPL = """path={file_path}{category_hint}
+---
+{recipe_text}"""
 
-@dataclass
+_BATCH_USER_PROMPT_TMPL = """请分别解析以下{count}个菜谱，返回 {{"recipes": [...]}}，数组包含{count}个菜谱对象，顺序与菜谱编号一致。
+
+{recipes}"""
+
+
+# 模型可能把字段返回为 null 或数字，统一规整为字符串
+_Text = Annotated[str, BeforeValidator(lambda value: "" if value is None else str(value))]
+_NoneAsList = BeforeValidator(lambda value: [] if value is None else value)
+_TextList = Annotated[List[_Text], _NoneAsList]
+
+
+def _none_as(default):
+    """null 规整为字段默认值"""
+    return BeforeValidator(lambda value: default if value is None else value)
+
+
+def _to_difficulty(value) -> int:
+    """难度为 null 或不是数字（如“简单”）时按默认的3星处理"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 3
+
+
+@dataclass(slots=True)
 class IngredientInfo:
     """食材信息"""
-    name: str
-    amount: str = ""
-    unit: str = ""
-    category: str = ""
-    is_main: bool = True  # 是否主要食材
+    name: _Text = ""
+    amount: _Text = ""
+    unit: _Text = ""
+    category: _Text = ""
+    is_main: Annotated[bool, _none_as(True)] = True  # 是否主要食材
 
 
-@dataclass
+@dataclass(slots=True)
 class CookingStep:
     """烹饪步骤"""
-    step_number: int
-    description: str
-    methods: List[str]  # 使用的烹饪方法
-    tools: List[str]  # 需要的工具
-    time_estimate: str = ""  # 时间估计
+    step_number: Annotated[int, _none_as(0)] = 0
+    description: _Text = ""
+    methods: _TextList = field(default_factory=list)  # 使用的烹饪方法
+    tools: _TextList = field(default_factory=list)  # 需要的工具
+    time_estimate: _Text = ""  # 时间估计
 
 
-@dataclass
+@dataclass(slots=True)
 class RecipeInfo:
     """菜谱信息"""
-    name: str
-    difficulty: int  # 1-5星
-    category: str
-    cuisine_type: str = ""  # 菜系
-    prep_time: str = ""
-    cook_time: str = ""
-    servings: str = ""
-    ingredients: List[IngredientInfo] = None
-    steps: List[CookingStep] = None
-    tags: List[str] = None
-    nutrition_info: Dict = None
-
-    def __post_init__(self):
-        if self.ingredients is None:
-            self.ingredients = []
-        if self.steps is None:
-            self.steps = []
-        if self.tags is None:
-            self.tags = []
-        if self.nutrition_info is None:
-            self.nutrition_info = {}
+    name: _Text = ""
+    difficulty: Annotated[int, BeforeValidator(_to_difficulty)] = 3  # 1-5星
+    category: _Text = ""
+    cuisine_type: _Text = ""  # 菜系
+    prep_time: _Text = ""
+    cook_time: _Text = ""
+    servings: _Text = ""
+    # null 在校验时直接规整为空列表/空字典，不需要 __post_init__ 再处理一遍
+    ingredients: Annotated[List[IngredientInfo], _NoneAsList] = field(default_factory=list)
+    steps: Annotated[List[CookingStep], _NoneAsList] = field(default_factory=list)
+    tags: _TextList = field(default_factory=list)
+    nutrition_info: Annotated[Dict, BeforeValidator(lambda value: {} if value is None else value)] = field(
+        default_factory=dict)
+
+
+@dataclass(slots=True)
+class _RecipeBatch:
+    """批量解析的响应：{"recipes": [...]}"""
+    recipes: List[RecipeInfo] = field(default_factory=list)
+
+
+# 直接把JSON文本校验并解析为RecipeInfo，不经过中间字典
+_RECIPE_ADAPTER = TypeAdapter(RecipeInfo)
+_BATCH_ADAPTER = TypeAdapter(_RecipeBatch)
+
+
+class _JsonObjectEnd:
+    """逐段扫描流式输出，找到顶层JSON对象的结束位置；字符串内的括号和转义字符不计入深度"""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> int:
+        """
+        :param text: 新收到的一段文本
+        :return: 顶层对象在该段中结束的下标（含右括号），未结束时返回 -1
+        """
+        # 不含结构字符的分片不影响状态，跳过逐字扫描
+        structural = '"\\' if self.in_string else '{}"'
+        if not self.escaped and not any(char in text for char in structural):
+            return -1
+        for index, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return index
+        return -1
+
+
+# 可重试的HTTP状态码：限流和服务端临时错误，其余4xx（如401/400）直接抛出
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+# 密钥、权限或模型配置错误：对所有菜谱都会失败，需要立即中止整批任务
+FATAL_ERRORS = (AuthenticationError, PermissionDeniedError, NotFoundError)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """判断API错误是否值得重试"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # 连接错误、超时以及流式读取中断都属于临时错误
+    return isinstance(error, (APIConnectionError, httpx.TransportError))
+
+
+def _backoff_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """重试等待时间：服务端给出 Retry-After 时按其等待，否则用带随机抖动的指数退避，避免并发请求同时重试"""
+    if isinstance(error, APIStatusError):
+        headers = error.response.headers
+        retry_after_ms = headers.get("retry-after-ms")
+        retry_after = float(retry_after_ms) / 1000 if retry_after_ms else _parse_reset_seconds(
+            headers.get("retry-after", ""))
+        if retry_after > 0:
+            return min(60, retry_after)
+    return min(30, 2 ** attempt * (0.5 + random.random()))
+
+
+def _parse_reset_seconds(value: str) -> float:
+    """解析限流重置时间，如 1s、6m0s、20ms"""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return 0.0
+    return sum(float(num) * units[unit] for num, unit in parts)
+
+
+class RateLimiter:
+    """客户端令牌桶限流器：同时按每分钟请求数(RPM)和令牌数(TPM)主动控速"""
+
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = max_requests_per_minute
+        self.available_token_capacity = max_tokens_per_minute
+        self.last_update = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """按流逝时间补充容量"""
+        elapsed = now - self.last_update
+        self.available_request_capacity = min(
+            self.max_requests_per_minute,
+            self.available_request_capacity + elapsed / 60 * self.max_requests_per_minute
+        )
+        self.available_token_capacity = min(
+            self.max_tokens_per_minute,
+            self.available_token_capacity + elapsed / 60 * self.max_tokens_per_minute
+        )
+        self.last_update = now
+
+    def _try_consume(self, estimated_tokens: int) -> float:
+        """尝试扣减容量，成功返回0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._refill(now)
+            # 单个请求的预估超过桶容量时按桶容量计，避免永远等待
+            tokens = min(estimated_tokens, self.max_tokens_per_minute)
+            if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                self.available_request_capacity -= 1
+                self.available_token_capacity -= tokens
+                return 0.0
+
+            request_wait = (1 - self.available_request_capacity) * 60 / self.max_requests_per_minute
+            token_wait = (tokens - self.available_token_capacity) * 60 / self.max_tokens_per_minute
+            return max(request_wait, token_wait, 0.01)
+
+    async def acquire(self, estimated_tokens: int):
+        """异步等待直到容量足够"""
+        while (delay := self._try_consume(estimated_tokens)) > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, estimated_tokens: int):
+        """同步等待直到容量足够"""
+        while (delay := self._try_consume(estimated_tokens)) > 0:
+            time.sleep(delay)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """用响应中的实际令牌消耗修正预估值"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            self.available_token_capacity += min(estimated_tokens, self.max_tokens_per_minute) - actual_tokens
+
+    def update_from_headers(self, headers):
+        """根据 x-ratelimit-* 响应头在运行时校准限额"""
+        with self._lock:
+            limit_requests = headers.get("x-ratelimit-limit-requests")
+            if limit_requests:
+                self.max_requests_per_minute = float(limit_requests)
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_tokens:
+                self.max_tokens_per_minute = float(limit_tokens)
+
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests is not None:
+                self.available_request_capacity = min(self.available_request_capacity, float(remaining_requests))
+                if float(remaining_requests) < 1:
+                    reset = _parse_reset_seconds(headers.get("x-ratelimit-reset-requests", ""))
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None:
+                self.available_token_capacity = min(self.available_token_capacity, float(remaining_tokens))
+                if float(remaining_tokens) < 1:
+                    reset = _parse_reset_seconds(headers.get("x-ratelimit-reset-tokens", ""))
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+
+class ResponseCache:
+    """基于SQLite的Kimi原始响应缓存，提示词和菜谱未改动时跳过API调用；WAL模式下可被多个进程共享"""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            return None  # 已过期
+        return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
 
 class KimiRecipeParser:
-    def __init__(self, aipi_key: str, base_url: str):
-        self.client = OpenAI(
-            api_key=aipi_key,
-            base_url=base_url,
+    # 目录名到分类的映射
+    directory_category_mapping = {
+        "vegetable_dish": "素菜",
+        "meat_dish": "荤菜",
+        "aquatic": "水产",
+        "breakfast": "早餐",
+        "staple": "主食",
+        "soup": "汤类",
+        "dessert": "甜品",
+        "drink": "饮料",
+        "condiment": "调料",
+        "semi-finished": "半成品"
+    }
+
+    # 排除的目录
+    excluded_directories = frozenset(["template", ".github", "tips", "starsystem"])
+
+    # 预定义的食材分类
+    ingredient_categories = {
+        "蔬菜": ("茄子", "辣椒", "洋葱", "大葱", "西红柿", "土豆", "萝卜", "白菜", "豆腐"),
+        "调料": ("盐", "酱油", "醋", "糖", "料酒", "生抽", "老抽", "蚝油", "味精"),
+        "蛋白质": ("鸡蛋", "肉", "鱼", "虾", "鸡", "猪", "牛", "羊"),
+        "淀粉类": ("面粉", "淀粉", "米", "面条", "面包", "土豆")
+    }
+
+    # 预定义的烹饪方法
+    cooking_methods = ("炒", "炸", "煮", "蒸", "烤", "炖", "焖", "煎", "红烧", "清炒", "爆炒")
+
+    # 预定义的工具
+    cooking_tools = ("炒锅", "平底锅", "蒸锅", "刀", "案板", "筷子", "锅铲", "勺子")
+
+    def __init__(self, aipi_key: str, base_url: str, max_concurrent: int = 10,
+                 rate_limiter: Optional[RateLimiter] = None, cache_path: Optional[str] = Config().cache_path,
+                 cache_ttl: Optional[float] = Config.cache_ttl):
+        # 重试由 call_kimi_api / call_kimi_api_async 自行处理，客户端不再重试
+        self._client_options = dict(api_key=aipi_key, base_url=base_url, timeout=API_TIMEOUT, max_retries=0)
+        self.client = OpenAI(**self._client_options)
+        # 异步客户端：批量解析时并发请求
+        self.async_client = AsyncOpenAI(**self._client_options)
+        self.model = Config.llm_model
+        self.max_tokens = Config.max_tokens
+        self.retry_max_tokens = Config.retry_max_tokens
+        self.max_input_tokens = Config.max_input_tokens
+        self.recipes_per_request = Config.recipes_per_request
+        self.cache = ResponseCache(cache_path, cache_ttl) if cache_path else None
+        # 同一目录下的菜谱分类相同，按目录缓存推断结果
+        self._infer_category_by_dir = functools.lru_cache(maxsize=1024)(self._infer_category_by_dir)
+        self.max_concurrent = max_concurrent
+        self.rate_limiter = rate_limiter or RateLimiter(Config.requests_per_minute, Config.tokens_per_minute)
+
+        # 一次匹配路径中第一个出现的分类目录
+        self._category_re = re.compile(
+            r"(?:^|/)(" + "|".join(map(re.escape, self.directory_category_mapping)) + r")(?:/|$)"
         )
 
-        # 目录名到分类的映射
-        self.directory_category_mapping = {
-            "vegetable_dish": "素菜",
-            "meat_dish": "荤菜",
-            "aquatic": "水产",
-            "breakfast": "早餐",
-            "staple": "主食",
-            "soup": "汤类",
-            "dessert": "甜品",
-            "drink": "饮料",
-            "condiment": "调料",
-            "semi-finished": "半成品"
-        }
+        # 食材到分类的反向索引（同一食材出现在多个分类时以先出现的为准）
+        self._ingredient_to_category = {}
+        for category, ingredients in self.ingredient_categories.items():
+            for ingredient in ingredients:
+                self._ingredient_to_category.setdefault(ingredient, category)
+        # 未精确命中时按名称中包含的已知食材归类，长词优先
+        self._ingredient_re = re.compile(
+            "|".join(map(re.escape, sorted(self._ingredient_to_category, key=len, reverse=True)))
+        )
 
-        # 排除的目录
-        self.excluded_directories = ["template", ".github", "tips", "starsystem"]
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+        """粗略估算一次请求消耗的令牌数（输入按字符数折算，加上输出上限）"""
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        return prompt_chars // CHARS_PER_TOKEN + max_tokens
+
+    def _open_stream(self, raw_response):
+        """把响应头反馈给限流器，并返回流式响应"""
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        return raw_response.parse()
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """取出流式分片中的增量文本"""
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return ""
+
+    @staticmethod
+    def _chunk_usage(chunk) -> Optional[int]:
+        """取出流式分片携带的令牌用量（通常只在最后一个分片中出现）"""
+        usage = getattr(chunk, "usage", None)
+        if usage is None and chunk.choices:
+            # Kimi 把用量放在最后一个分片的 choice 中
+            usage = getattr(chunk.choices[0], "usage", None)
+        if usage is None:
+            return None
+        return usage.get("total_tokens") if isinstance(usage, dict) else usage.total_tokens
+
+    def _read_stream(self, stream, estimated_tokens: int) -> str:
+        """
+        边接收边累积流式响应，只保留顶层JSON对象
+        对象结束后继续读取空白分片以拿到最后的用量；模型在对象之后继续输出其他内容时才提前关闭连接
+        """
+        buffer = io.StringIO()
+        tracker = _JsonObjectEnd()
+        finished = False
+        usage_tokens = None
+        for chunk in stream:
+            usage_tokens = self._chunk_usage(chunk) or usage_tokens
+            text = self._chunk_text(chunk)
+            if not finished:
+                end = tracker.feed(text)
+                if end < 0:
+                    buffer.write(text)
+                    continue
+                buffer.write(text[:end + 1])
+                finished, text = True, text[end + 1:]
+            if text.strip():
+                stream.close()
+                break
+        self.rate_limiter.record_usage(estimated_tokens, usage_tokens)
+        return buffer.getvalue()
+
+    async def _read_stream_async(self, stream, estimated_tokens: int) -> str:
+        """边接收边累积流式响应（异步），规则同 _read_stream"""
+        buffer = io.StringIO()
+        tracker = _JsonObjectEnd()
+        finished = False
+        usage_tokens = None
+        async for chunk in stream:
+            usage_tokens = self._chunk_usage(chunk) or usage_tokens
+            text = self._chunk_text(chunk)
+            if not finished:
+                end = tracker.feed(text)
+                if end < 0:
+                    buffer.write(text)
+                    continue
+                buffer.write(text[:end + 1])
+                finished, text = True, text[end + 1:]
+            if text.strip():
+                await stream.close()
+                break
+        self.rate_limiter.record_usage(estimated_tokens, usage_tokens)
+        return buffer.getvalue()
+
+    def call_kimi_api(self, messages: List[Dict], max_retries: int = 3, max_tokens: Optional[int] = None) -> str:
+        """调用Kimi API"""
+        max_tokens = max_tokens or self.max_tokens
+        last_error = None
+        for attempt in range(max_retries):
+            estimated_tokens = self._estimate_tokens(messages, max_tokens)
+            self.rate_limiter.acquire_sync(estimated_tokens)
+            try:
+                raw_response = self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.6,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                stream = self._open_stream(raw_response)
 
-        # 预定义的食材分类
-        self.ingredient_categories = {
-            "蔬菜": ["茄子", "辣椒", "洋葱", "大葱", "西红柿", "土豆", "萝卜", "白菜", "豆腐"],
-            "调料": ["盐", "酱油", "醋", "糖", "料酒", "生抽", "老抽", "蚝油", "味精"],
-            "蛋白质": ["鸡蛋", "肉", "鱼", "虾", "鸡", "猪", "牛", "羊"],
-            "淀粉类": ["面粉", "淀粉", "米", "面条", "面包", "土豆"]
-        }
+                return self._read_stream(stream, estimated_tokens)
 
-        # 预定义的烹饪方法
-        self.cooking_methods = ["炒", "炸", "煮", "蒸", "烤", "炖", "焖", "煎", "红烧", "清炒", "爆炒"]
+            except Exception as e:
+                logger.warning("API调用错误 (尝试 %d): %s", attempt + 1, e)
+                if not _is_retryable(e):
+                    raise
+                last_error = e
+                if attempt < max_retries - 1:
+                    time.sleep(_backoff_delay(attempt, e))
 
-        # 预定义的工具
-        self.cooking_tools = ["炒锅", "平底锅", "蒸锅", "刀", "案板", "筷子", "锅铲", "勺子"]
+        raise Exception("Kimi API调用失败") from last_error
 
-    def call_kimi_api(self, messages: List[Dict], max_retries: int = 3) -> str:
-        """调用Kimi API"""
+    async def call_kimi_api_async(self, messages: List[Dict], max_retries: int = 3,
+                                  max_tokens: Optional[int] = None) -> str:
+        """异步调用Kimi API"""
+        max_tokens = max_tokens or self.max_tokens
+        last_error = None
         for attempt in range(max_retries):
+            estimated_tokens = self._estimate_tokens(messages, max_tokens)
+            await self.rate_limiter.acquire(estimated_tokens)
             try:
-                response = self.client.chat.completions.create(
-                    model="kimi-k2-0711-preview",
+                raw_response = await self.async_client.chat.completions.with_raw_response.create(
+                    model=self.model,
                     messages=messages,
                     temperature=0.6,
-                    max_tokens=2048,
-                    stream=False
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                    stream=True
                 )
+                stream = self._open_stream(raw_response)
 
-                return response.choices[0].message.content
+                return await self._read_stream_async(stream, estimated_tokens)
 
             except Exception as e:
-                print(f"API调用错误 (尝试 {attempt + 1}): {str(e)}")
+                logger.warning("API调用错误 (尝试 %d): %s", attempt + 1, e)
+                if not _is_retryable(e):
+                    raise
+                last_error = e
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # 指数退避
+                    await asyncio.sleep(_backoff_delay(attempt, e))  # 不阻塞事件循环
 
-        raise Exception("Kimi API调用失败")
+        raise Exception("Kimi API调用失败") from last_error
 
     def infer_category_by_path(self, file_path: str) -> str:
         """根据文件路径推断菜谱分类"""
-        path_parts = file_path.replace('\\', '/').split('/')
+        directory = file_path.replace('\\', '/').rpartition('/')[0]
+        return self._infer_category_by_dir(directory)
 
-        for part in path_parts:
-            if part in self.directory_category_mapping:
-                return self.directory_category_mapping[part]
+    def _infer_category_by_dir(self, directory: str) -> str:
+        """根据菜谱所在目录推断分类"""
+        match = self._category_re.search(directory)
+        if match:
+            return self.directory_category_mapping[match.group(1)]
 
         return ""  # 如果无法推断，返回空字符串
 
-    def parse_recipe(self, recipe_text: str, file_path):
-        """解析菜谱： 根据kimi提取的结果，构建实体节点和节点之间的关系"""
+    def classify_ingredient(self, name: str) -> str:
+        """根据预定义食材分类推断食材类别"""
+        category = self._ingredient_to_category.get(name)
+        if category:
+            return category
+
+        known = max(self._ingredient_re.findall(name), key=len, default=None)
+        return self._ingredient_to_category[known] if known else "其他"
+
+    def _build_messages(self, recipe_text: str, file_path: str) -> List[Dict]:
+        """构建菜谱解析的对话消息"""
+        # 截断超长菜谱，保证输入令牌数有上限
+        max_chars = self.max_input_tokens * CHARS_PER_TOKEN
+        if len(recipe_text) > max_chars:
+            recipe_text = recipe_text[:max_chars]
+
         inferred_category = self.infer_category_by_path(file_path)
-        # 构建提示词
-        category_hint = f"，根据文件路径推断此菜谱属于【{inferred_category}】分类" if inferred_category else ""
-
-        prompt = f"""
-        请分析以下标准化格式的菜谱Markdown文档，提取结构化信息并以JSON格式返回。
-
-        文件路径: {file_path}
-        菜谱内容：
-        {recipe_text}
-
-        ## 文档结构说明
-        此菜谱遵循标准格式，包含以下固定二级标题：
-        - ## 必备原料和工具：列出所有食材和工具
-        - ## 计算：包含份量计算和具体用量
-        - ## 操作：详细的烹饪步骤
-        - ## 附加内容：补充说明和技巧提示（需要过滤无关内容）
-
-        ## 提取规则
-        1. **菜谱名称**：从一级标题（# XXX的做法）提取
-        2. **难度等级**：从"预估烹饪难度：★★★"中统计★的数量
-        3. **菜谱分类**：可以是多个分类，用逗号分隔（如"早餐,素菜"表示既是早餐又是素菜）
-        4. **食材信息**：从"必备原料和工具"和"计算"部分提取，合并用量信息
-        5. **烹饪步骤**：从"操作"部分的有序列表提取
-        6. **技巧补充**：从"附加内容"提取有用的烹饪技巧，忽略模板文字（如"如果您遵循本指南...Issue或Pull request"等）
-
-        请返回标准JSON格式{category_hint}：
-        {{
-            "name": "菜谱名称（去掉'的做法'后缀）",
-            "difficulty": 1-5的数字（根据★数量：★=1, ★★=2, ★★★=3, ★★★★=4, ★★★★★=5），
-            "category": "{inferred_category if inferred_category else '菜谱分类（素菜/荤菜/水产/早餐/主食/汤类/甜品/饮料/调料，支持多个分类用逗号分隔，如"早餐,素菜"）'}",
-            "cuisine_type": "菜系（川菜/粤菜/鲁菜/苏菜/闽菜/浙菜/湘菜/徽菜/东北菜/西北菜/等，如果不明确则为空）",
-            "prep_time": "准备时间（从腌制、切菜等步骤推断）",
-            "cook_time": "烹饪时间（从炒制、炖煮等步骤推断）", 
-            "servings": "份数/人数（从'计算'部分提取，如'2个人食用'）",
-            "ingredients": [
-                {{
-                    "name": "食材名称",
-                    "amount": "用量数字（从计算部分提取具体数值）",
-                    "unit": "单位（克、个、毫升、片等）",
-                    "category": "食材类别（蔬菜/调料/蛋白质/淀粉类/其他）",
-                    "is_main": true/false（主要食材为true，调料为false）
-                }}
-            ],
-            "steps": [
-                {{
-                    "step_number": 1,
-                    "description": "步骤详细描述",
-                    "methods": ["使用的烹饪方法：炒、炸、煮、蒸、烤、炖、焖、煎、红烧、腌制、切等"],
-                    "tools": ["需要的工具：炒锅、平底锅、蒸锅、刀、案板、筷子、锅铲、盆等"],
-                    "time_estimate": "时间估计（如步骤中提到'15秒'、'30秒'、'10-15分钟'等）"
-                }}
-            ],
-            "tags": ["从附加内容中提取的有用技巧标签"],
-            "nutrition_info": {{
-                "calories": "",
-                "protein": "", 
-                "carbs": "",
-                "fat": ""
-            }}
-        }}
-
-        ## 重要提示：
-        1. 从"计算"部分精确提取食材用量和单位
-        2. 从"操作"部分的有序列表逐步解析烹饪步骤
-        3. 从"附加内容"中只提取烹饪技巧，忽略"Issue或Pull request"等模板文字
-        4. 食材分类要准确：蔬菜（包括各种菜类）、调料（盐、酱油、糖等）、蛋白质（鱼、肉、蛋）、淀粉类（面粉、米等）
-        5. 菜谱分类支持多重分类：如早餐类的蔬菜粥可以分类为"早餐,素菜,主食"（逗号分隔）
-        6. 当遇到"适量"、"少许"等非具体数值时，不要忘记加引号，如"amount": "适量"
-        7. 只返回标准JSON格式，确保语法正确
+        category_hint = f"\ncategory_hint={inferred_category}" if inferred_category else ""
+        prompt = _USER_PROMPT_TMPL.format(file_path=file_path, category_hint=category_hint, recipe_text=recipe_text)
+
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _output_token_budget(self, recipe_text: str) -> int:
+        """按菜谱长度估算输出令牌上限：输出规模与输入大致成正比，短菜谱不必预留完整的 max_tokens"""
+        return min(self.max_tokens, max(512, int(len(recipe_text) * 1.5 / CHARS_PER_TOKEN)))
+
+    def _cache_key(self, messages: List[Dict]) -> str:
+        """响应缓存的键：模型和完整提示词（系统提示词、文件路径、菜谱内容），任一变化都会重新请求"""
+        raw_key = "\0".join([self.model] + [message["content"] for message in messages])
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _cached_recipe(self, cache_key: str, file_path: str) -> Optional[RecipeInfo]:
         """
+        从缓存中取出菜谱的解析结果
+        :return: 未命中或缓存的响应不再通过校验时返回 None（缓存的是原始响应，解析规则变化后按未命中处理，重新请求后覆盖）
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        try:
+            return self._to_recipe_info(cached)
+        except ValueError as e:
+            logger.warning("缓存的响应校验失败，重新请求: %s: %s", file_path, e)
+            return None
 
-        messages = [
-            {"role": "system", "content": "你是一个专业的菜谱分析专家，擅长从中文菜谱中提取结构化信息。"},
+    def parse_recipe(self, recipe_text: str, file_path):
+        """解析菜谱： 根据kimi提取的结果，构建实体节点和节点之间的关系"""
+        messages = self._build_messages(recipe_text, file_path)
+        cache_key = self._cache_key(messages)
+        recipe_info = self._cached_recipe(cache_key, file_path)
+        if recipe_info is not None:
+            return recipe_info
+
+        response = self.call_kimi_api(messages, max_tokens=self._output_token_budget(recipe_text))
+        try:
+            recipe_info = self._to_recipe_info(response)
+        except ValueError:  # JSON语法错误或字段校验失败
+            # 重试时放开到完整的输出上限，避免因输出被截断再次失败
+            response = self.call_kimi_api(messages + [_STRICT_JSON_MESSAGE], max_tokens=self.retry_max_tokens)
+            recipe_info = self._to_recipe_info(response)
+        if self.cache is not None:
+            self.cache.set(cache_key, response)
+        return recipe_info
+
+    async def parse_recipe_async(self, recipe_text: str, file_path: str) -> RecipeInfo:
+        """异步解析菜谱"""
+        messages = self._build_messages(recipe_text, file_path)
+        cache_key = self._cache_key(messages)
+        recipe_info = self._cached_recipe(cache_key, file_path)
+        if recipe_info is not None:
+            return recipe_info
+
+        response = await self.call_kimi_api_async(messages, max_tokens=self._output_token_budget(recipe_text))
+        try:
+            recipe_info = self._to_recipe_info(response)
+        except ValueError:  # JSON语法错误或字段校验失败
+            # 重试时放开到完整的输出上限，避免因输出被截断再次失败
+            response = await self.call_kimi_api_async(messages + [_STRICT_JSON_MESSAGE],
+                                                      max_tokens=self.retry_max_tokens)
+            recipe_info = self._to_recipe_info(response)
+        if self.cache is not None:
+            self.cache.set(cache_key, response)
+        return recipe_info
+
+    async def stream_parsed(self, items: Iterable[Tuple[str, str]], concurrency: Optional[int] = None,
+                            recipes_per_request: Optional[int] = None):
+        """
+        并发解析多个菜谱，按完成顺序逐个产出结果，下游可以边解析边构建图谱
+        :param items: (菜谱内容, 文件路径) 的可迭代对象，可以是按需读取文件的生成器
+        :param concurrency: 最大并发请求数，默认使用 max_concurrent
+        :param recipes_per_request: 每次请求合并解析的菜谱数，默认使用 recipes_per_request 配置
+        :return: 异步产出 (文件路径, RecipeInfo 或解析失败的异常)；遇到 FATAL_ERRORS 时取消其余任务并抛出
+        """
+        limit = concurrency or self.max_concurrent
+        groups = self._plan_batches(items, recipes_per_request or self.recipes_per_request)
+
+        async def _parse(group_items: List[Tuple[str, str]]):
+            results = await self._parse_group_async(group_items)
+            return [(file_path, result) for (_, file_path), result in zip(group_items, results)]
+
+        # 滑动窗口：同时最多 limit 个任务，完成一个才取下一组，内存中只保留在途的菜谱
+        in_flight, done = set(), set()
+        try:
+            for group_items in groups:
+                in_flight.add(asyncio.create_task(_parse(group_items)))
+                if len(in_flight) < limit:
+                    continue
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for pair in task.result():
+                        yield pair
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for pair in task.result():
+                        yield pair
+        finally:
+            for task in in_flight:
+                task.cancel()
+            # 同一轮完成的其他任务也要取走结果，避免未处理异常的警告
+            await asyncio.gather(*in_flight, *done, return_exceptions=True)
+
+    def _build_batch_messages(self, items: List[Tuple[str, str]]) -> List[Dict]:
+        """构建多菜谱合并解析的对话消息"""
+        recipe_blocks = []
+        for index, (recipe_text, file_path) in enumerate(items, start=1):
+            inferred_category = self.infer_category_by_path(file_path)
+            category_note = f", category_hint={inferred_category}" if inferred_category else ""
+            recipe_blocks.append(f"---RECIPE {index} (path={file_path}{category_note})---\n{recipe_text}")
+
+        prompt = _BATCH_USER_PROMPT_TMPL.format(count=len(items), recipes="\n\n".join(recipe_blocks))
+
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ]
-        response = self.call_kimi_api(messages)
-
-        # 清理响应，确保是有效的JSON
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        # 解析JSON
-        recipe_data = json.loads(response)
-        print(f"菜谱信息：{recipe_data}")
-        # 转换为RecipeInfo对象
-        recipe_info = RecipeInfo(
-            name=recipe_data.get("name", ""),
-            difficulty=recipe_data.get("difficulty", 3),
-            category=recipe_data.get("category", ""),
-            cuisine_type=recipe_data.get("cuisine_type", ""),
-            prep_time=recipe_data.get("prep_time", ""),
-            cook_time=recipe_data.get("cook_time", ""),
-            servings=recipe_data.get("servings", ""),
-            nutrition_info=recipe_data.get("nutrition_info", {})
-        )
-        # 转换食材信息
-        for ing_data in recipe_data.get("ingredients", []):
-            ingredient = IngredientInfo(
-                name=ing_data.get("name", ""),
-                amount=ing_data.get("amount", ""),
-                unit=ing_data.get("unit", ""),
-                category=ing_data.get("category", ""),
-                is_main=ing_data.get("is_main", True)
-            )
-            recipe_info.ingredients.append(ingredient)
-
-        # 转换步骤信息
-        for step_data in recipe_data.get("steps", []):
-            step = CookingStep(
-                step_number=step_data.get("step_number", 0),
-                description=step_data.get("description", ""),
-                methods=step_data.get("methods", []),
-                tools=step_data.get("tools", []),
-                time_estimate=step_data.get("time_estimate", "")
-            )
-            recipe_info.steps.append(step)
 
-        # 添加标签
-        recipe_info.tags = recipe_data.get("tags", [])
+    def _plan_batches(self, items: Iterable[Tuple[str, str]], batch_size: int):
+        """按顺序把菜谱分组：每组最多 batch_size 个，且合并后的菜谱内容不超过输入令牌上限；按需产出，不预先展开"""
+        group, group_tokens = [], 0
+        for recipe_text, file_path in items:
+            tokens = len(recipe_text) // CHARS_PER_TOKEN
+            if group and (len(group) >= batch_size or group_tokens + tokens > self.max_input_tokens):
+                yield group
+                group, group_tokens = [], 0
+            group.append((recipe_text, file_path))
+            group_tokens += tokens
+        if group:
+            yield group
+
+    @staticmethod
+    def _decode_batch(response: str, count: int) -> Optional[List[RecipeInfo]]:
+        """校验合并请求的响应，数量与请求的菜谱数不符时返回 None；JSON无效时抛出 ValueError"""
+        recipes = _BATCH_ADAPTER.validate_json(response).recipes
+        return recipes if len(recipes) == count else None
+
+    async def _request_batch_async(self, pending_items: List[Tuple[str, str]]) -> Optional[List[RecipeInfo]]:
+        """发出一次合并解析请求，JSON无效时以严格JSON提示重试一次；结果仍不可用时返回 None"""
+        messages = self._build_batch_messages(pending_items)
+        max_tokens = sum(self._output_token_budget(recipe_text) for recipe_text, _ in pending_items)
+        response = await self.call_kimi_api_async(messages, max_tokens=max_tokens)
+        try:
+            return self._decode_batch(response, len(pending_items))
+        except ValueError:  # JSON语法错误或字段校验失败
+            pass
+        response = await self.call_kimi_api_async(messages + [_STRICT_JSON_MESSAGE],
+                                                  max_tokens=self.retry_max_tokens * len(pending_items))
+        try:
+            return self._decode_batch(response, len(pending_items))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _as_failure(error: Exception) -> Exception:
+        """FATAL_ERRORS 直接抛出，其余异常作为对应菜谱的失败结果返回"""
+        if isinstance(error, FATAL_ERRORS):
+            raise error
+        return error
+
+    def _lookup_group(self, group_items: List[Tuple[str, str]]) -> Tuple[List, List[Tuple[int, str]]]:
+        """
+        逐个查询组内菜谱的缓存
+        :return: (结果列表, 未命中缓存的 (组内下标, 缓存键))；读取缓存出错的位置为对应异常
+        """
+        results: List = [None] * len(group_items)
+        pending = []
+        for index, (recipe_text, file_path) in enumerate(group_items):
+            try:
+                cache_key = self._cache_key(self._build_messages(recipe_text, file_path))
+                recipe_info = self._cached_recipe(cache_key, file_path)
+                if recipe_info is not None:
+                    results[index] = recipe_info
+                else:
+                    pending.append((index, cache_key))
+            except Exception as e:
+                results[index] = self._as_failure(e)
+        return results, pending
+
+    def _store_group(self, results: List, pending: List[Tuple[int, str]], recipes: List[RecipeInfo]):
+        """填入合并解析的结果并写入缓存，缓存写入失败的位置为对应异常"""
+        for (index, cache_key), recipe_info in zip(pending, recipes):
+            try:
+                if self.cache is not None:
+                    self.cache.set(cache_key, _RECIPE_ADAPTER.dump_json(recipe_info).decode("utf-8"))
+                results[index] = recipe_info
+            except Exception as e:
+                results[index] = self._as_failure(e)
 
+    async def _parse_group_async(self, group_items: List[Tuple[str, str]]) -> List:
+        """
+        合并解析一组菜谱；命中缓存的直接返回，合并结果不可用时退回逐个解析
+        :return: 与 group_items 顺序一致的列表，解析失败的位置为对应异常；FATAL_ERRORS 直接抛出
+        """
+        if len(group_items) == 1:
+            try:
+                return [await self.parse_recipe_async(*group_items[0])]
+            except Exception as e:
+                return [self._as_failure(e)]
+
+        results, pending = self._lookup_group(group_items)
+        recipes = None
+        if len(pending) > 1:
+            try:
+                recipes = await self._request_batch_async([group_items[index] for index, _ in pending])
+            except Exception as e:
+                # 合并请求本身失败（如重试耗尽），组内未命中缓存的菜谱都记为失败
+                for index, _ in pending:
+                    results[index] = self._as_failure(e)
+                return results
+            if recipes is None:
+                logger.warning("合并解析结果不可用，逐个解析 %d 个菜谱", len(pending))
+
+        if recipes is None:
+            for index, _ in pending:
+                try:
+                    results[index] = await self.parse_recipe_async(*group_items[index])
+                except Exception as e:
+                    results[index] = self._as_failure(e)
+        else:
+            self._store_group(results, pending, recipes)
+        return results
+
+    def _to_recipe_info(self, response: str) -> RecipeInfo:
+        """将Kimi返回的JSON文本校验并转换为RecipeInfo"""
+        recipe_info = _RECIPE_ADAPTER.validate_json(response)
+        logger.debug("菜谱信息：%s", recipe_info)
         return recipe_info
 
+    def close(self):
+        """关闭客户端和响应缓存；用过异步客户端时应先在其事件循环中调用 aclose"""
+        self.client.close()
+        if not self.async_client.is_closed():
+            # 没有在事件循环中用过的异步客户端可以在新的事件循环中关闭
+            asyncio.run(self.async_client.close())
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose(self):
+        """
+        关闭异步客户端：它的连接属于发出请求的事件循环，必须在该循环结束前关闭
+        之后换上一个没有连接的新客户端，下一个事件循环仍可使用
+        """
+        await self.async_client.close()
+        self.async_client = AsyncOpenAI(**self._client_options)
+
+
+# 同义词语言检测：删除英文字母/空白/连字符，长度差即英文字符数（空白字符都在 U+3000 以内）
+_EN_DELETE_TABLE = str.maketrans(dict.fromkeys(
+    string.ascii_letters + "-" + "".join(chr(code) for code in range(0x3001) if chr(code).isspace())
+))
+
+# 菜名中的烹饪方法及其同义写法（只有真正的同义词才映射）
+COOKING_METHOD_MAPPINGS = {
+    "红烧": ("braised",),  # 红烧 = 英文braised
+    "糖醋": ("sweet and sour",),  # 糖醋 = 英文sweet and sour
+    "清炒": ("炒制", "stir-fried"),  # 清炒 = 炒制 = 英文stir-fried
+    "蒸": ("清蒸", "steamed"),  # 蒸 = 清蒸 = 英文steamed
+    "炖": ("煲", "stewed"),  # 炖 = 煲 = 英文stewed
+    "烤": ("烘烤", "roasted", "baked"),  # 烤 = 烘烤 = 英文roasted/baked
+    "炸": ("油炸", "deep-fried"),  # 炸 = 油炸 = 英文deep-fried
+    "焖": ("闷", "braised"),  # 焖 = 闷 = 某种形式的braised
+    "煎": ("pan-fried",),  # 煎 = 英文pan-fried
+    "爆炒": ("stir-fried",),  # 爆炒 = stir-fried的一种
+    "白切": ("boiled",),  # 白切 = 水煮的一种
+    "油焖": ("oil-braised",)  # 油焖 = oil-braised
+}
+
+# 菜名中的主要食材及其别名
+INGREDIENT_ALIASES = {
+    "茄子": ("青茄子", "紫茄子", "eggplant"),
+    "土豆": ("马铃薯", "洋芋", "potato"),
+    "西红柿": ("番茄", "tomato"),
+    "青椒": ("彩椒", "甜椒", "bell pepper"),
+    "豆腐": ("嫩豆腐", "老豆腐", "tofu"),
+    "白菜": ("大白菜", "小白菜", "cabbage"),
+    "萝卜": ("白萝卜", "胡萝卜", "radish")
+}
+
+# 菜名中的地域特色及其别名
+REGIONAL_MAPPINGS = {
+    "川味": ("四川风味", "川菜风格"),
+    "粤式": ("广东风味", "粤菜风格"),
+    "京味": ("北京风味", "京菜风格"),
+    "湘味": ("湖南风味", "湘菜风格")
+}
+
+# 食材同义词词典
+INGREDIENT_SYNONYM_DICT = {
+    # 蔬菜类
+    "青茄子": ("茄子", "紫茄子", "圆茄"),
+    "西红柿": ("番茄", "洋柿子"),
+    "土豆": ("马铃薯", "洋芋", "地蛋"),
+    "红薯": ("地瓜", "甘薯", "山芋"),
+    "玉米": ("苞米", "玉蜀黍"),
+    "青椒": ("柿子椒", "甜椒", "彩椒"),
+    "大葱": ("葱白", "韭葱"),
+    "小葱": ("香葱", "细葱"),
+    "香菜": ("芫荽", "胡荽"),
+    "菠菜": ("赤根菜", "波斯菜"),
+
+    # 调料类
+    "生抽": ("淡色酱油", "鲜味酱油"),
+    "老抽": ("深色酱油", "红烧酱油"),
+    "料酒": ("黄酒", "绍兴酒"),
+    "白糖": ("细砂糖", "绵白糖"),
+    "冰糖": ("冰片糖", "块糖"),
+    "八角": ("大料", "茴香"),
+
+    # 蛋白质类
+    "鸡蛋": ("鸡子", "土鸡蛋"),
+    "豆腐": ("水豆腐", "嫩豆腐")
+}
+
+
+def _keyword_matcher(keywords) -> Tuple[re.Pattern, Dict[str, Tuple[str, ...]]]:
+    """
+    把一组关键词编译成一次扫描：零宽先行断言让重叠的关键词（如"油焖"和"焖"）都能匹配到
+    同一位置只报告最长的关键词，从该位置开始的较短关键词一定是它的前缀（如"红烧肉"中的"红烧"），由前缀表补上
+    """
+    ordered = sorted(keywords, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+    prefixes = {key: tuple(other for other in ordered if other != key and key.startswith(other)) for key in ordered}
+    return pattern, prefixes
+
+
+def _find_keywords(matcher: Tuple[re.Pattern, Dict[str, Tuple[str, ...]]], text: str) -> List[str]:
+    """返回文本中出现的所有关键词，去重并保持出现顺序（同一位置先长后短）"""
+    pattern, prefixes = matcher
+    found = {}
+    for match in pattern.finditer(text):
+        keyword = match.group(1)
+        found[keyword] = None
+        found.update(dict.fromkeys(prefixes[keyword]))
+    return list(found)
+
+
+_COOKING_METHOD_MATCHER = _keyword_matcher(COOKING_METHOD_MAPPINGS)
+_INGREDIENT_ALIAS_MATCHER = _keyword_matcher(INGREDIENT_ALIASES)
+_REGION_MATCHER = _keyword_matcher(REGIONAL_MAPPINGS)
+
 
 class RecipeKnowledgeGraphBuilder:
     """菜谱知识图谱构建器"""
 
+    # 关系类型映射
+    relationship_type_mapping = {
+        "has_ingredient": "801000001",
+        "requires_tool": "801000002",
+        "has_step": "801000003",
+        "belongs_to_category": "801000004",
+        "has_difficulty": "801000005",
+        "uses_method": "801000006",
+        "has_amount": "801000007",
+        "step_follows": "801000008",
+        "serves_people": "801000009",
+        "cooking_time": "801000010",
+        "prep_time": "801000011"
+    }
+
+    # 菜谱分类对应的预定义分类概念ID
+    category_mapping = {
+        "素菜": "710000000",
+        "荤菜": "720000000",
+        "水产": "730000000",
+        "早餐": "740000000",
+        "主食": "750000000",
+        "汤类": "760000000",
+        "甜品": "770000000",
+        "饮料": "780000000",
+        "调料": "790000000"
+    }
+
+    # 难度星级对应的预定义难度概念ID
+    difficulty_mapping = {
+        1: "610000000",  # 一星
+        2: "620000000",  # 二星
+        3: "630000000",  # 三星
+        4: "640000000",  # 四星
+        5: "650000000"  # 五星
+    }
+
+    # 预定义概念
+    predefined_concepts = [
+        # 根概念
+        {
+            "concept_id": "100000000",
+            "concept_type": "Root",
+            "name": "烹饪概念",
+            "fsn": "烹饪概念 (Culinary Concept)",
+            "preferred_term": "烹饪概念"
+        },
+
+        # 顶级概念
+        {
+            "concept_id": "200000000",
+            "concept_type": "Recipe",
+            "name": "菜谱",
+            "fsn": "菜谱 (Recipe)",
+            "preferred_term": "菜谱"
+        },
+        {
+            "concept_id": "300000000",
+            "concept_type": "Ingredient",
+            "name": "食材",
+            "fsn": "食材 (Ingredient)",
+            "preferred_term": "食材"
+        },
+        {
+            "concept_id": "400000000",
+            "concept_type": "CookingMethod",
+            "name": "烹饪方法",
+            "fsn": "烹饪方法 (Cooking Method)",
+            "preferred_term": "烹饪方法"
+        },
+        {
+            "concept_id": "500000000",
+            "concept_type": "CookingTool",
+            "name": "烹饪工具",
+            "fsn": "烹饪工具 (Cooking Tool)",
+            "preferred_term": "烹饪工具"
+        },
+
+        # 难度等级
+        {
+            "concept_id": "610000000",
+            "concept_type": "DifficultyLevel",
+            "name": "一星",
+            "fsn": "一星 (One Star)",
+            "preferred_term": "一星"
+        },
+        {
+            "concept_id": "620000000",
+            "concept_type": "DifficultyLevel",
+            "name": "二星",
+            "fsn": "二星 (Two Star)",
+            "preferred_term": "二星"
+        },
+        {
+            "concept_id": "630000000",
+            "concept_type": "DifficultyLevel",
+            "name": "三星",
+            "fsn": "三星 (Three Star)",
+            "preferred_term": "三星"
+        },
+        {
+            "concept_id": "640000000",
+            "concept_type": "DifficultyLevel",
+            "name": "四星",
+            "fsn": "四星 (Four Star)",
+            "preferred_term": "四星"
+        },
+        {
+            "concept_id": "650000000",
+            "concept_type": "DifficultyLevel",
+            "name": "五星",
+            "fsn": "五星 (Five Star)",
+            "preferred_term": "五星"
+        },
+
+        # 菜谱分类
+        {
+            "concept_id": "710000000",
+            "concept_type": "RecipeCategory",
+            "name": "素菜",
+            "fsn": "素菜 (Vegetarian Dish)",
+            "preferred_term": "素菜"
+        },
+        {
+            "concept_id": "720000000",
+            "concept_type": "RecipeCategory",
+            "name": "荤菜",
+            "fsn": "荤菜 (Meat Dish)",
+            "preferred_term": "荤菜"
+        },
+        {
+            "concept_id": "730000000",
+            "concept_type": "RecipeCategory",
+            "name": "水产",
+            "fsn": "水产 (Aquatic Product)",
+            "preferred_term": "水产"
+        },
+        {
+            "concept_id": "740000000",
+            "concept_type": "RecipeCategory",
+            "name": "早餐",
+            "fsn": "早餐 (Breakfast)",
+            "preferred_term": "早餐"
+        },
+        {
+            "concept_id": "750000000",
+            "concept_type": "RecipeCategory",
+            "name": "主食",
+            "fsn": "主食 (Staple Food)",
+            "preferred_term": "主食"
+        },
+        {
+            "concept_id": "760000000",
+            "concept_type": "RecipeCategory",
+            "name": "汤类",
+            "fsn": "汤类 (Soup)",
+            "preferred_term": "汤类"
+        },
+        {
+            "concept_id": "770000000",
+            "concept_type": "RecipeCategory",
+            "name": "甜品",
+            "fsn": "甜品 (Dessert)",
+            "preferred_term": "甜品"
+        },
+        {
+            "concept_id": "780000000",
+            "concept_type": "RecipeCategory",
+            "name": "饮料",
+            "fsn": "饮料 (Beverage)",
+            "preferred_term": "饮料"
+        },
+        {
+            "concept_id": "790000000",
+            "concept_type": "RecipeCategory",
+            "name": "调料",
+            "fsn": "调料 (Condiment)",
+            "preferred_term": "调料"
+        }
+    ]
+
+    # 流式写出的CSV列：各类概念字段的并集，缺少的字段留空
+    concept_fields = (
+        "concept_id", "concept_type", "name", "fsn", "preferred_term", "synonyms", "category",
+        "difficulty", "cuisine_type", "prep_time", "cook_time", "servings", "tags", "file_path",
+        "description", "step_number", "methods", "tools", "time_estimate"
+    )
+    relationship_fields = (
+        "relationship_id", "source_id", "target_id", "relationship_type", "amount", "unit", "is_main", "step_order"
+    )
+
     def __init__(self, ai_agent: KimiRecipeParser, output_dir: str = "./ai_output", batch_size: int = 20):
         self.current_batch = 0
         self.ai_agent = ai_agent
         self.output_dir = output_dir
         self.batch_size = batch_size
         self.concept_id_counter = 201000000
-        self.concepts = []  # 概念
-        self.relationships = []  # 关系
+        self.rel_id_counter = 0
+        self.concept_count = 0  # 已写出的概念数
+        self.relationship_count = 0  # 已写出的关系数
+        self._ingredient_index = {}  # 规范化食材名 -> 概念ID，同名食材在所有菜谱间共用一个概念
 
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
 
-        # 初始化预定义概念和关系类型映射
-        self._init_predefined_concepts()
-        self._init_relationship_mappings()
-
-    def _init_relationship_mappings(self):
-        """初始化关系类型映射"""
-        self.relationship_type_mapping = {
-            "has_ingredient": "801000001",
-            "requires_tool": "801000002",
-            "has_step": "801000003",
-            "belongs_to_category": "801000004",
-            "has_difficulty": "801000005",
-            "uses_method": "801000006",
-            "has_amount": "801000007",
-            "step_follows": "801000008",
-            "serves_people": "801000009",
-            "cooking_time": "801000010",
-            "prep_time": "801000011"
-        }
-
-    def _init_predefined_concepts(self):
-        """初始化预定义概念"""
-        self.predefined_concepts = [
-            # 根概念
-            {
-                "concept_id": "100000000",
-                "concept_type": "Root",
-                "name": "烹饪概念",
-                "fsn": "烹饪概念 (Culinary Concept)",
-                "preferred_term": "烹饪概念"
-            },
-
-            # 顶级概念
-            {
-                "concept_id": "200000000",
-                "concept_type": "Recipe",
-                "name": "菜谱",
-                "fsn": "菜谱 (Recipe)",
-                "preferred_term": "菜谱"
-            },
-            {
-                "concept_id": "300000000",
-                "concept_type": "Ingredient",
-                "name": "食材",
-                "fsn": "食材 (Ingredient)",
-                "preferred_term": "食材"
-            },
-            {
-                "concept_id": "400000000",
-                "concept_type": "CookingMethod",
-                "name": "烹饪方法",
-                "fsn": "烹饪方法 (Cooking Method)",
-                "preferred_term": "烹饪方法"
-            },
-            {
-                "concept_id": "500000000",
-                "concept_type": "CookingTool",
-                "name": "烹饪工具",
-                "fsn": "烹饪工具 (Cooking Tool)",
-                "preferred_term": "烹饪工具"
-            },
-
-            # 难度等级
-            {
-                "concept_id": "610000000",
-                "concept_type": "DifficultyLevel",
-                "name": "一星",
-                "fsn": "一星 (One Star)",
-                "preferred_term": "一星"
-            },
-            {
-                "concept_id": "620000000",
-                "concept_type": "DifficultyLevel",
-                "name": "二星",
-                "fsn": "二星 (Two Star)",
-                "preferred_term": "二星"
-            },
-            {
-                "concept_id": "630000000",
-                "concept_type": "DifficultyLevel",
-                "name": "三星",
-                "fsn": "三星 (Three Star)",
-                "preferred_term": "三星"
-            },
-            {
-                "concept_id": "640000000",
-                "concept_type": "DifficultyLevel",
-                "name": "四星",
-                "fsn": "四星 (Four Star)",
-                "preferred_term": "四星"
-            },
-            {
-                "concept_id": "650000000",
-                "concept_type": "DifficultyLevel",
-                "name": "五星",
-                "fsn": "五星 (Five Star)",
-                "preferred_term": "五星"
-            },
-
-            # 菜谱分类
-            {
-                "concept_id": "710000000",
-                "concept_type": "RecipeCategory",
-                "name": "素菜",
-                "fsn": "素菜 (Vegetarian Dish)",
-                "preferred_term": "素菜"
-            },
-            {
-                "concept_id": "720000000",
-                "concept_type": "RecipeCategory",
-                "name": "荤菜",
-                "fsn": "荤菜 (Meat Dish)",
-                "preferred_term": "荤菜"
-            },
-            {
-                "concept_id": "730000000",
-                "concept_type": "RecipeCategory",
-                "name": "水产",
-                "fsn": "水产 (Aquatic Product)",
-                "preferred_term": "水产"
-            },
-            {
-                "concept_id": "740000000",
-                "concept_type": "RecipeCategory",
-                "name": "早餐",
-                "fsn": "早餐 (Breakfast)",
-                "preferred_term": "早餐"
-            },
-            {
-                "concept_id": "750000000",
-                "concept_type": "RecipeCategory",
-                "name": "主食",
-                "fsn": "主食 (Staple Food)",
-                "preferred_term": "主食"
-            },
-            {
-                "concept_id": "760000000",
-                "concept_type": "RecipeCategory",
-                "name": "汤类",
-                "fsn": "汤类 (Soup)",
-                "preferred_term": "汤类"
-            },
-            {
-                "concept_id": "770000000",
-                "concept_type": "RecipeCategory",
-                "name": "甜品",
-                "fsn": "甜品 (Dessert)",
-                "preferred_term": "甜品"
-            },
-            {
-                "concept_id": "780000000",
-                "concept_type": "RecipeCategory",
-                "name": "饮料",
-                "fsn": "饮料 (Beverage)",
-                "preferred_term": "饮料"
-            },
-            {
-                "concept_id": "790000000",
-                "concept_type": "RecipeCategory",
-                "name": "调料",
-                "fsn": "调料 (Condiment)",
-                "preferred_term": "调料"
-            }
-        ]
+        # 概念和关系逐行写入当前批次的CSV，不在内存中累积
+        self.batch_output_dir = os.path.join(output_dir, f"batch_{self.current_batch:03d}")
+        os.makedirs(self.batch_output_dir, exist_ok=True)
+        self._concept_file = open(os.path.join(self.batch_output_dir, "concepts.csv"), 'w',
+                                  newline='', encoding='utf-8', buffering=1 << 20)
+        self._concept_writer = csv.DictWriter(self._concept_file, fieldnames=self.concept_fields)
+        self._concept_writer.writeheader()
+        self._relationship_file = open(os.path.join(self.batch_output_dir, "relationships.csv"), 'w',
+                                       newline='', encoding='utf-8', buffering=1 << 20)
+        self._relationship_writer = csv.DictWriter(self._relationship_file, fieldnames=self.relationship_fields)
+        self._relationship_writer.writeheader()
+
+        # 断点续跑：已处理菜谱的概念和关系逐条追加到 progress.jsonl，删除该文件即可从头开始
+        self._progress_path = os.path.join(output_dir, "progress.jsonl")
+        self._done = set()
+        self._load_progress()
+
+    def _load_progress(self):
+        """从 progress.jsonl 恢复已处理菜谱：重新写出其概念和关系，并恢复ID计数器和食材索引"""
+        if not os.path.exists(self._progress_path):
+            return
+        valid_end = 0  # 最后一条完整记录之后的偏移
+        with open(self._progress_path, 'rb') as f:
+            for line in f:
+                # 中断时可能写了半行：从这里截断，之后的记录都丢弃，对应菜谱重新处理，
+                # 不能跳过它继续恢复，后面的记录可能引用了它创建的食材概念
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                valid_end += len(line)
+                self._done.add(record["file_path"])
+                self._write_rows(record["concepts"], record["relationships"])
+                for concept in record["concepts"]:
+                    self.concept_id_counter = max(self.concept_id_counter, int(concept["concept_id"]))
+                    if concept["concept_type"] == "Ingredient":
+                        self._ingredient_index[self._ingredient_key(concept["name"])] = concept["concept_id"]
+                for rel in record["relationships"]:
+                    self.rel_id_counter = max(self.rel_id_counter, int(rel["relationship_id"][2:]))
+        if valid_end < os.path.getsize(self._progress_path):
+            # 截掉残缺的尾部，下一条记录不会接在半行后面
+            with open(self._progress_path, 'r+b') as f:
+                f.truncate(valid_end)
+            logger.warning("断点文件末尾的记录不完整，已截断")
+        logger.info("从断点恢复: 已处理 %d 个菜谱", len(self._done))
+
+    def _save_progress(self, file_path: str, concepts: List[Dict], relationships: List[Dict]):
+        """把一个菜谱的概念和关系追加到 progress.jsonl"""
+        record = {"file_path": file_path, "concepts": concepts, "relationships": relationships}
+        with open(self._progress_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._done.add(file_path)
+
+    def _write_rows(self, concepts: List[Dict], relationships: List[Dict]):
+        """把概念和关系写入CSV（概念构建时已是最终的行格式）"""
+        self._concept_writer.writerows(concepts)
+        self._relationship_writer.writerows(relationships)
+        self.concept_count += len(concepts)
+        self.relationship_count += len(relationships)
+
+    def _flush_writers(self):
+        """把缓冲中的CSV行写到磁盘"""
+        if not self._concept_file.closed:
+            self._concept_file.flush()
+            self._relationship_file.flush()
+
+    def close(self):
+        """关闭流式写出的CSV文件"""
+        self._concept_file.close()
+        self._relationship_file.close()
 
     def _is_english(self, text: str) -> bool:
         """检测是否为英文"""
-        import re
+        if not text:
+            return False
         # 检查是否主要包含英文字母和空格
-        english_chars = re.findall(r'[a-zA-Z\s\-]', text)
-        return len(english_chars) / len(text) > 0.7 if text else False
-
-    def _is_chinese(self, text: str) -> bool:
-        """检测是否为中文"""
-        import re
-        # 检查是否包含中文字符
-        chinese_chars = re.findall(r'[\u4e00-\u9fff]', text)
-        return len(chinese_chars) > 0
+        english_count = len(text) - len(text.translate(_EN_DELETE_TABLE))
+        return english_count / len(text) > 0.7
 
     def _generate_recipe_synonyms(self, name: str, category: str):
         """生成菜谱的同义词列表"""
         synonyms = []
+        add_synonym = synonyms.append
 
         # 基于菜谱名称生成变体
         if name.endswith("的做法"):
             base_name = name.replace("的做法", "")
-            synonyms.extend([
-                f"{base_name}制作方法",
-                f"{base_name}烹饪方法",
-                base_name
-            ])
+            add_synonym(f"{base_name}制作方法")
+            add_synonym(f"{base_name}烹饪方法")
+            add_synonym(base_name)
 
         # 基于烹饪方法生成别名（注意：只有真正的同义词才映射）
-        cooking_method_mappings = {
-            "红烧": ["braised"],  # 红烧 = 英文braised
-            "糖醋": ["sweet and sour"],  # 糖醋 = 英文sweet and sour
-            "清炒": ["炒制", "stir-fried"],  # 清炒 = 炒制 = 英文stir-fried
-            "蒸": ["清蒸", "steamed"],  # 蒸 = 清蒸 = 英文steamed
-            "炖": ["煲", "stewed"],  # 炖 = 煲 = 英文stewed
-            "烤": ["烘烤", "roasted", "baked"],  # 烤 = 烘烤 = 英文roasted/baked
-            "炸": ["油炸", "deep-fried"],  # 炸 = 油炸 = 英文deep-fried
-            "焖": ["闷", "braised"],  # 焖 = 闷 = 某种形式的braised
-            "煎": ["pan-fried"],  # 煎 = 英文pan-fried
-            "爆炒": ["stir-fried"],  # 爆炒 = stir-fried的一种
-            "白切": ["boiled"],  # 白切 = 水煮的一种
-            "油焖": ["oil-braised"]  # 油焖 = oil-braised
-        }
-
-        for method, variants in cooking_method_mappings.items():
-            if method in name:
-                for variant in variants:
-                    if variant != method:  # 避免重复
-                        synonym = name.replace(method, variant)
-                        if synonym != name:
-                            synonyms.append(synonym)
+        for method in _find_keywords(_COOKING_METHOD_MATCHER, name):
+            for variant in COOKING_METHOD_MAPPINGS[method]:
+                if variant != method:  # 避免重复
+                    synonym = name.replace(method, variant)
+                    if synonym != name:
+                        add_synonym(synonym)
 
         # 基于食材生成别名（提取主要食材）
-        ingredient_aliases = {
-            "茄子": ["青茄子", "紫茄子", "eggplant"],
-            "土豆": ["马铃薯", "洋芋", "potato"],
-            "西红柿": ["番茄", "tomato"],
-            "青椒": ["彩椒", "甜椒", "bell pepper"],
-            "豆腐": ["嫩豆腐", "老豆腐", "tofu"],
-            "白菜": ["大白菜", "小白菜", "cabbage"],
-            "萝卜": ["白萝卜", "胡萝卜", "radish"]
-        }
-
-        for ingredient, aliases in ingredient_aliases.items():
-            if ingredient in name:
-                for alias in aliases:
-                    if alias != ingredient:
-                        synonym = name.replace(ingredient, alias)
-                        if synonym != name:
-                            synonyms.append(synonym)
-
-        # 基于地域特色添加别名
-        regional_mappings = {
-            "川味": ["四川风味", "川菜风格"],
-            "粤式": ["广东风味", "粤菜风格"],
-            "京味": ["北京风味", "京菜风格"],
-            "湘味": ["湖南风味", "湘菜风格"]
-
-        }
-
-        for region, variants in regional_mappings.items():
-            if region in name:
-                for variant in variants:
-                    synonym = name.replace(region, variant)
+        for ingredient in _find_keywords(_INGREDIENT_ALIAS_MATCHER, name):
+            for alias in INGREDIENT_ALIASES[ingredient]:
+                if alias != ingredient:
+                    synonym = name.replace(ingredient, alias)
                     if synonym != name:
-                        synonyms.append(synonym)
+                        add_synonym(synonym)
 
-        # 去重并返回，按语言分类
-        unique_synonyms = list(set(synonyms))
+        # 基于地域特色添加别名
+        for region in _find_keywords(_REGION_MATCHER, name):
+            for variant in REGIONAL_MAPPINGS[region]:
+                synonym = name.replace(region, variant)
+                if synonym != name:
+                    add_synonym(synonym)
+
+        # 去重（保持生成顺序）并返回，按语言分类
+        unique_synonyms = list(dict.fromkeys(synonyms))
         return self._categorize_synonyms_by_language(unique_synonyms)
 
     def _categorize_synonyms_by_language(self, synonyms) -> List[dict]:
@@ -537,21 +1260,14 @@ class RecipeKnowledgeGraphBuilder:
         categorized = []
 
         for synonym in synonyms:
-            # 检测语言
+            # 检测语言：不是英文的都归为中文（含汉字或无法判断时结果相同），不必再逐字扫描汉字
             if self._is_english(synonym):
                 categorized.append({
                     "term": synonym,
                     "language": "en",
                     "language_code": "en-US"
                 })
-            elif self._is_chinese(synonym):
-                categorized.append({
-                    "term": synonym,
-                    "language": "zh",
-                    "language_code": "zh-CN"
-                })
             else:
-                # 默认为中文
                 categorized.append({
                     "term": synonym,
                     "language": "zh",
@@ -565,53 +1281,64 @@ class RecipeKnowledgeGraphBuilder:
         self.concept_id_counter += 1
         return str(self.concept_id_counter)
 
+    @staticmethod
+    def _ingredient_key(name: str) -> str:
+        """食材去重用的规范化名称"""
+        return name.strip().lower()
+
+    def _next_rel_id(self) -> str:
+        """生成新的关系ID"""
+        self.rel_id_counter += 1
+        return f"R_{self.rel_id_counter:06d}"
+
     def _generate_ingredient_synonyms(self, name: str) -> List[dict]:
         """生成食材的同义词列表"""
-        ingredient_synonym_dict = {
-            # 蔬菜类
-            "青茄子": ["茄子", "紫茄子", "圆茄"],
-            "西红柿": ["番茄", "洋柿子"],
-            "土豆": ["马铃薯", "洋芋", "地蛋"],
-            "红薯": ["地瓜", "甘薯", "山芋"],
-            "玉米": ["苞米", "玉蜀黍"],
-            "青椒": ["柿子椒", "甜椒", "彩椒"],
-            "大葱": ["葱白", "韭葱"],
-            "小葱": ["香葱", "细葱"],
-            "香菜": ["芫荽", "胡荽"],
-            "菠菜": ["赤根菜", "波斯菜"],
-
-            # 调料类
-            "生抽": ["淡色酱油", "鲜味酱油"],
-            "老抽": ["深色酱油", "红烧酱油"],
-            "料酒": ["黄酒", "绍兴酒"],
-            "白糖": ["细砂糖", "绵白糖"],
-            "冰糖": ["冰片糖", "块糖"],
-            "八角": ["大料", "茴香"],
-
-            # 蛋白质类
-            "鸡蛋": ["鸡子", "土鸡蛋"],
-            "豆腐": ["水豆腐", "嫩豆腐"]
-        }
 
-        synonyms = ingredient_synonym_dict.get(name, [])
+        synonyms = INGREDIENT_SYNONYM_DICT.get(name, ())
         return self._categorize_synonyms_by_language(synonyms)
 
     def process_recipe(self, markdown_content: str, file_path: str) -> Dict:
         """处理单个菜谱"""
         recipe_info = self.ai_agent.parse_recipe(markdown_content, file_path)
+        return self.add_recipe_info(recipe_info, file_path)
 
-        # 生成概念ID
-        recipe_id = self.generate_concept_id()
+    async def process_recipes_async(self, items: Iterable[Tuple[str, str]],
+                                    total: Optional[int] = None) -> Tuple[int, int]:
+        """
+        并发解析多个菜谱（最多 batch_size 个请求同时进行），每解析完一个立即构建其概念和关系
+        :param items: (菜谱内容, 文件路径) 的可迭代对象
+        :param total: 菜谱总数，仅用于显示进度；items 为列表时可省略
+        :return: (成功数, 失败数)
+        """
+        if total is None:
+            total = len(items)
+        processed, failed = 0, 0
+        async for file_path, result in self.ai_agent.stream_parsed(items, concurrency=self.batch_size):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.warning("处理文件失败: %s: %s", file_path, result)
+            else:
+                self.add_recipe_info(result, file_path)
+                processed += 1
+            logger.info("进度 [%d/%d]: %s", processed + failed, total, file_path)
+        return processed, failed
+
+    def _build_graph_entries(self, recipe_info: RecipeInfo, file_path: str) -> Tuple[Dict, List[Dict]]:
+        """
+        构建菜谱概念和步骤概念（不含ID）；ID分配和食材去重在 add_recipe_info 中完成
+        :return: (菜谱概念, 步骤概念列表)
+        """
+        name = recipe_info.name
+        category = recipe_info.category
 
-        # 创建菜谱概念
+        # 创建菜谱概念；同义词在这里序列化为JSON，写CSV和断点时不再转换
         recipe_concept = {
-            "concept_id": recipe_id,
             "concept_type": "Recipe",  # 概念类型 食谱
-            "name": recipe_info.name,  # 食谱名称名称
-            "fsn": f"{recipe_info.name} (Recipe)",
-            "preferred_term": recipe_info.name,  # 首选属于
-            "synonyms": self._generate_recipe_synonyms(recipe_info.name, recipe_info.category),  # 同义词
-            "category": recipe_info.category,  # 分类
+            "name": name,  # 食谱名称名称
+            "fsn": f"{name} (Recipe)",
+            "preferred_term": name,  # 首选属于
+            "synonyms": json.dumps(self._generate_recipe_synonyms(name, category), ensure_ascii=False),  # 同义词
+            "category": category,  # 分类
             "difficulty": recipe_info.difficulty,  # 难度
             "cuisine_type": recipe_info.cuisine_type,  # 菜系
             "prep_time": recipe_info.prep_time,  # 准备时间
@@ -621,130 +1348,130 @@ class RecipeKnowledgeGraphBuilder:
             "file_path": file_path  # 文件路径
         }
 
-        self.concepts.append(recipe_concept)
+        step_concepts = []
+        for step in recipe_info.steps:
+            step_number = step.step_number
+            step_name = f"步骤{step_number}"
+            step_concepts.append({
+                "concept_type": "CookingStep",
+                "name": step_name,
+                "fsn": f"{step_name} (Cooking Step)",
+                "preferred_term": step_name,
+                "description": step.description,
+                "step_number": step_number,
+                "methods": ",".join(step.methods),
+                "tools": ",".join(step.tools),
+                "time_estimate": step.time_estimate
+            })
+        return recipe_concept, step_concepts
+
+    def add_recipe_info(self, recipe_info: RecipeInfo, file_path: str) -> Dict:
+        """把解析好的菜谱构建为CSV行格式的概念和关系写出，并写入断点记录"""
+        recipe_concept, step_concepts = self._build_graph_entries(recipe_info, file_path)
+        relationships = []
+        relationship_types = self.relationship_type_mapping
+
+        # 分配概念ID：菜谱、新食材、步骤依次编号
+        recipe_id = self.generate_concept_id()
+        recipe_concept["concept_id"] = recipe_id
+        concepts = [recipe_concept]
+
+        has_ingredient = relationship_types["has_ingredient"]
         for ingredient in recipe_info.ingredients:
-            ing_id = self.generate_concept_id()
-            ing_concept = {
-                "concept_id": ing_id,
-                "concept_type": "Ingredient",
-                "name": ingredient.name,
-                "fsn": f"{ingredient.name} (Ingredient)",
-                "preferred_term": ingredient.name,
-                "synonyms": self._generate_ingredient_synonyms(ingredient.name),
-                "category": ingredient.category,
-                "amount": ingredient.amount,
-                "unit": ingredient.unit,
-                "is_main": ingredient.is_main
-            }
-            self.concepts.append(ing_concept)
+            ingredient_name = ingredient.name
+            # 同名食材只在第一次出现时创建概念，用量等菜谱相关信息放在关系上
+            ingredient_key = self._ingredient_key(ingredient_name)
+            ing_id = self._ingredient_index.get(ingredient_key)
+            if ing_id is None:
+                ing_id = self.generate_concept_id()
+                self._ingredient_index[ingredient_key] = ing_id
+                concepts.append({
+                    "concept_id": ing_id,
+                    "concept_type": "Ingredient",
+                    "name": ingredient_name,
+                    "fsn": f"{ingredient_name} (Ingredient)",
+                    "preferred_term": ingredient_name,
+                    "synonyms": json.dumps(self._generate_ingredient_synonyms(ingredient_name), ensure_ascii=False),
+                    "category": ingredient.category or self.ai_agent.classify_ingredient(ingredient_name)
+                })
 
             # 添加关系：菜谱包含食材
-            self.relationships.append({
-                "relationship_id": f"R_{len(self.relationships) + 1:06d}",
+            relationships.append({
+                "relationship_id": self._next_rel_id(),
                 "source_id": recipe_id,
                 "target_id": ing_id,
-                "relationship_type": self.relationship_type_mapping["has_ingredient"],
+                "relationship_type": has_ingredient,
                 "amount": ingredient.amount,
-                "unit": ingredient.unit
+                "unit": ingredient.unit,
+                "is_main": ingredient.is_main
             })
 
-            # 处理步骤
-        for step in recipe_info.steps:
+        # 处理步骤
+        has_step = relationship_types["has_step"]
+        for step_concept in step_concepts:
             step_id = self.generate_concept_id()
-            step_concept = {
-                "concept_id": step_id,
-                "concept_type": "CookingStep",
-                "name": f"步骤{step.step_number}",
-                "fsn": f"步骤{step.step_number} (Cooking Step)",
-                "preferred_term": f"步骤{step.step_number}",
-                "description": step.description,
-                "step_number": step.step_number,
-                "methods": ",".join(step.methods),
-                "tools": ",".join(step.tools),
-                "time_estimate": step.time_estimate
-            }
-            self.concepts.append(step_concept)
+            step_concept["concept_id"] = step_id
+            concepts.append(step_concept)
 
             # 添加关系：菜谱包含步骤
-            self.relationships.append({
-                "relationship_id": f"R_{len(self.relationships) + 1:06d}",
+            relationships.append({
+                "relationship_id": self._next_rel_id(),
                 "source_id": recipe_id,
                 "target_id": step_id,
-                "relationship_type": self.relationship_type_mapping["has_step"],
-                "step_order": step.step_number
+                "relationship_type": has_step,
+                "step_order": step_concept["step_number"]
             })
 
         # 添加分类关系 - 支持多重分类
-        category_mapping = {
-            "素菜": "710000000",
-            "荤菜": "720000000",
-            "水产": "730000000",
-            "早餐": "740000000",
-            "主食": "750000000",
-            "汤类": "760000000",
-            "甜品": "770000000",
-            "饮料": "780000000",
-            "调料": "790000000"
-        }
-
-        categories = [cat.strip() for cat in recipe_info.category.split(',') if cat.strip()]
-        for category in categories:
-            if category in category_mapping:
-                self.relationships.append({
-                    "relationship_id": f"R_{len(self.relationships) + 1:06d}",
+        for category_name in recipe_info.category.split(','):
+            category_id = self.category_mapping.get(category_name.strip())
+            if category_id:
+                relationships.append({
+                    "relationship_id": self._next_rel_id(),
                     "source_id": recipe_id,
-                    "target_id": category_mapping[category],
-                    "relationship_type": self.relationship_type_mapping["belongs_to_category"]
+                    "target_id": category_id,
+                    "relationship_type": relationship_types["belongs_to_category"]
                 })
 
         # 添加难度关系
-        difficulty_mapping = {
-            1: "610000000",  # 一星
-            2: "620000000",  # 二星
-            3: "630000000",  # 三星
-            4: "640000000",  # 四星
-            5: "650000000"  # 五星
-        }
-
-        if recipe_info.difficulty in difficulty_mapping:
-            self.relationships.append({
-                "relationship_id": f"R_{len(self.relationships) + 1:06d}",
+        difficulty_id = self.difficulty_mapping.get(recipe_info.difficulty)
+        if difficulty_id:
+            relationships.append({
+                "relationship_id": self._next_rel_id(),
                 "source_id": recipe_id,
-                "target_id": difficulty_mapping[recipe_info.difficulty],
-                "relationship_type": self.relationship_type_mapping["has_difficulty"]
+                "target_id": difficulty_id,
+                "relationship_type": relationship_types["has_difficulty"]
             })
 
+        self._write_rows(concepts, relationships)
+        self._save_progress(file_path, concepts, relationships)
         return recipe_concept
 
     def save_batch_data(self, batch_num: int = None):
-        """保存当前批次数据"""
+        """保存当前批次数据：概念和关系已逐行写出，这里只需刷到磁盘"""
         if batch_num is None:
             batch_num = self.current_batch
 
-        batch_output_dir = os.path.join(self.output_dir, f"batch_{batch_num:03d}")
-        os.makedirs(batch_output_dir, exist_ok=True)
-
-        # 保存概念数据
-        if self.concepts:
-            concepts_df = pd.DataFrame(self.concepts)
-            concepts_file = os.path.join(batch_output_dir, "concepts.csv")
-            concepts_df.to_csv(concepts_file, index=False, encoding='utf-8')
-
-        # 保存关系数据
-        if self.relationships:
-            relationships_df = pd.DataFrame(self.relationships)
-            relationships_file = os.path.join(batch_output_dir, "relationships.csv")
-            relationships_df.to_csv(relationships_file, index=False, encoding='utf-8')
-
+        self._flush_writers()
         print(f"批次 {batch_num} 已保存")
 
-        return batch_output_dir
+        return self.batch_output_dir
+
+    def _iter_recipe_files(self, root_dir: str):
+        """遍历目录下的菜谱Markdown文件，不进入排除目录和隐藏目录"""
+        excluded = self.ai_agent.excluded_directories
+        for current_dir, dir_names, file_names in os.walk(root_dir):
+            # 原地裁剪，os.walk 不会再进入被排除的子目录
+            dir_names[:] = sorted(d for d in dir_names if d not in excluded and not d.startswith("."))
+            for file_name in sorted(file_names):
+                if file_name.endswith(".md") and not file_name.startswith("."):
+                    yield os.path.join(current_dir, file_name)
 
     def batch_process_recipes(self, recipe_dir: str):
         """
-        量处理菜谱目录
-        :param recipe_dir:
-        :return:
+        批量处理菜谱目录，最多同时发出 batch_size 个解析请求
+        :param recipe_dir: 菜谱根目录
+        :return: (成功数, 失败数)
         """
         # 扫描dishes目录
         dishes_dir = os.path.join(recipe_dir, "dishes")
@@ -755,90 +1482,93 @@ class RecipeKnowledgeGraphBuilder:
         else:
             print(f"扫描菜谱目录: {dishes_dir}")
 
-        recipe_files = glob.glob(os.path.join(dishes_dir, "**/*.md"), recursive=True)
-        for i, recipe_file in enumerate(recipe_files):
+        # 先收集待处理的路径，菜谱内容在解析时按需读取；图谱构建在事件循环线程上串行执行，不需要加锁
+        pending = []
+        skipped = 0
+        for recipe_file in self._iter_recipe_files(dishes_dir):
+            relative_path = os.path.relpath(recipe_file, recipe_dir)
+            if relative_path in self._done:
+                skipped += 1
+                continue
+            pending.append((recipe_file, relative_path))
+        if skipped:
+            logger.info("跳过断点中已处理的 %d 个菜谱", skipped)
+
+        async def _run() -> Tuple[int, int]:
             try:
-                with open(recipe_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                return await self.process_recipes_async(self._read_recipes(pending), len(pending))
+            finally:
+                await self.ai_agent.aclose()
 
-                relative_path = os.path.relpath(recipe_file, recipe_dir)
-                print(f"处理文件lkk: {relative_path}")
-                # 处理菜谱
-                self.process_recipe(content, relative_path)
-            except Exception as e:
-                print(f"处理文件失败: {relative_path}")
-                print(e)
+        processed, parse_failed = asyncio.run(_run())
         self.save_batch_data(self.current_batch)
 
+        # 读取失败的菜谱不会进入解析，按差值计入失败数
+        read_failed = len(pending) - processed - parse_failed
+        return processed, read_failed + parse_failed
+
+    @staticmethod
+    def _read_recipes(pending: List[Tuple[str, str]]):
+        """按需读取菜谱文件，产出 (菜谱内容, 相对路径)；读取失败的记录日志后跳过"""
+        for recipe_file, relative_path in pending:
+            try:
+                with open(recipe_file, 'r', encoding='utf-8') as f:
+                    recipe_text = f.read()
+            except OSError as e:
+                logger.warning("读取文件失败: %s: %s", relative_path, e)
+                continue
+            yield recipe_text, relative_path
+
     def export_to_csv(self, output_dir: str):
         """导出为CSV格式"""
         os.makedirs(output_dir, exist_ok=True)
+        self._flush_writers()
 
-        # 导出概念
-        concepts_df = pd.DataFrame(self.concepts)
-        concepts_df.to_csv(os.path.join(output_dir, "concepts.csv"),
-                           index=False, encoding='utf-8')
-
-        # 导出关系
-        relationships_df = pd.DataFrame(self.relationships)
-        relationships_df.to_csv(os.path.join(output_dir, "relationships.csv"),
-                                index=False, encoding='utf-8')
+        # 概念和关系已流式写入批次目录，直接复制
+        for file_name in ("concepts.csv", "relationships.csv"):
+            shutil.copyfile(os.path.join(self.batch_output_dir, file_name), os.path.join(output_dir, file_name))
 
         print(f"CSV文件已导出到: {output_dir}")
-        print(f"- 概念数量: {len(self.concepts)}")
-        print(f"- 关系数量: {len(self.relationships)}")
+        print(f"- 概念数量: {self.concept_count}")
+        print(f"- 关系数量: {self.relationship_count}")
 
     def merge_all_batches(self):
         """合并所有批次数据到最终输出文件"""
-        final_concepts = DataFrame()
-        final_relationships = DataFrame()
+        self._flush_writers()
         print("合并批次数据...")
 
-        all_concepts = []
-        all_relationships = []
-
         # 收集所有批次数据
         batch_dirs = [d for d in os.listdir(self.output_dir)
                       if d.startswith("batch_") and os.path.isdir(os.path.join(self.output_dir, d))]
         batch_dirs.sort()
 
-        for batch_dir in batch_dirs:
-            batch_path = os.path.join(self.output_dir, batch_dir)
-
-            # 读取概念文件
-            concepts_file = os.path.join(batch_path, "concepts.csv")
-            if os.path.exists(concepts_file):
-                batch_concepts = pd.read_csv(concepts_file)
-                all_concepts.append(batch_concepts)
-
-            # 读取关系文件
-            relationships_file = os.path.join(batch_path, "relationships.csv")
-            if os.path.exists(relationships_file):
-                batch_relationships = pd.read_csv(relationships_file)
-                all_relationships.append(batch_relationships)
-
-        # 合并数据
-        if all_concepts:
-            final_concepts = pd.concat(all_concepts, ignore_index=True)
-            final_concepts.to_csv(os.path.join(self.output_dir, "concepts.csv"),
-                                  index=False, encoding='utf-8')
-            print(f"合并概念: {len(final_concepts)} 个")
-
-        if all_relationships:
-            final_relationships = pd.concat(all_relationships, ignore_index=True)
-            final_relationships.to_csv(os.path.join(self.output_dir, "relationships.csv"),
-                                       index=False, encoding='utf-8')
-            print(f"合并关系: {len(final_relationships)} 个")
-
-        return len(final_concepts) if all_concepts else 0, len(final_relationships) if all_relationships else 0
+        counts = []
+        for file_name, fieldnames in (("concepts.csv", self.concept_fields),
+                                      ("relationships.csv", self.relationship_fields)):
+            count = 0
+            with open(os.path.join(self.output_dir, file_name), 'w', newline='', encoding='utf-8') as out:
+                writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                # 逐行复制各批次文件，不把数据整体读入内存
+                for batch_dir in batch_dirs:
+                    batch_file = os.path.join(self.output_dir, batch_dir, file_name)
+                    if not os.path.exists(batch_file):
+                        continue
+                    with open(batch_file, 'r', newline='', encoding='utf-8') as f:
+                        for row in csv.DictReader(f):
+                            writer.writerow(row)
+                            count += 1
+            counts.append(count)
+
+        print(f"合并概念: {counts[0]} 个")
+        print(f"合并关系: {counts[1]} 个")
+
+        return counts[0], counts[1]
 
     def _format_synonyms_for_neo4j(self, synonyms) -> str:
         """格式化同义词用于Neo4j导出"""
-        import pandas as pd
-        import json
-
-        # 处理NaN值和空值
-        if pd.isna(synonyms) or not synonyms:
+        # 处理空值
+        if not synonyms:
             return ""
 
         # 如果是字符串，尝试解析为JSON
@@ -870,117 +1600,100 @@ class RecipeKnowledgeGraphBuilder:
 
         return "|".join(formatted_terms)
 
+    # Neo4j 导出文件的列
+    neo4j_node_fields = (
+        "nodeId", "labels", "name", "preferredTerm", "fsn", "conceptType", "synonyms", "category",
+        "difficulty", "cuisineType", "prepTime", "cookTime", "servings", "tags", "filePath",
+        "description", "stepNumber", "methods", "tools", "timeEstimate"
+    )
+    neo4j_relationship_fields = ("startNodeId", "endNodeId", "relationshipType", "relationshipId") + tuple(
+        field_name for field_name in relationship_fields
+        if field_name not in ("source_id", "target_id", "relationship_type", "relationship_id")
+    )
+
     def export_to_neo4j_csv(self, output_dir: str, merge_batches: bool = True):
         """导出为Neo4j导入格式的CSV - 支持合并批次数据"""
         os.makedirs(output_dir, exist_ok=True)
 
-        # 如果需要合并批次数据
-        final_concepts = []
-        final_relationships = []
-
+        # 读取合并后的批次数据，或当前批次流式写出的数据
         if merge_batches:
-            # 先尝试合并所有批次数据
-            total_concepts, total_relationships = self.merge_all_batches()
-
-            # 如果有合并的数据，使用合并后的数据
-            if total_concepts > 0:
-                concepts_df = pd.read_csv(os.path.join(output_dir, "concepts.csv"))
-                final_concepts = concepts_df.to_dict('records')
-            else:
-                final_concepts = self.concepts
-
-            if total_relationships > 0:
-                relationships_df = pd.read_csv(os.path.join(output_dir, "relationships.csv"))
-                final_relationships = relationships_df.to_dict('records')
-            else:
-                final_relationships = self.relationships
+            self.merge_all_batches()
+            data_dir = output_dir
         else:
-            # 使用当前内存中的数据
-            final_concepts = self.concepts
-            final_relationships = self.relationships
-
-        # 准备节点数据
-        nodes_data = []
-
-        # 首先添加预定义概念
-        for predefined_concept in self.predefined_concepts:
-            node = {
-                "nodeId": predefined_concept["concept_id"],
-                "labels": predefined_concept["concept_type"],
-                "name": predefined_concept["name"],
-                "preferredTerm": predefined_concept.get("preferred_term", ""),
-                "fsn": predefined_concept.get("fsn", ""),
-                "conceptType": predefined_concept["concept_type"],
-                "synonyms": self._format_synonyms_for_neo4j(predefined_concept.get("synonyms", []))
-            }
-            nodes_data.append(node)
-
-        # 然后添加动态生成的概念
-        for concept in final_concepts:
-            node = {
-                "nodeId": concept["concept_id"],
-                "labels": concept["concept_type"],
-                "name": concept["name"],
-                "preferredTerm": concept.get("preferred_term", ""),
-                "category": concept.get("category", ""),
-                "conceptType": concept["concept_type"],
-                "synonyms": self._format_synonyms_for_neo4j(concept.get("synonyms", []))
-            }
-
-            # 添加特定类型的属性
-            if concept["concept_type"] == "Recipe":
-                node.update({
-                    "difficulty": concept.get("difficulty", ""),
-                    "cuisineType": concept.get("cuisine_type", ""),
-                    "prepTime": concept.get("prep_time", ""),
-                    "cookTime": concept.get("cook_time", ""),
-                    "servings": concept.get("servings", ""),
-                    "tags": concept.get("tags", ""),
-                    "filePath": concept.get("file_path", "")
+            self._flush_writers()
+            data_dir = self.batch_output_dir
+
+        # 导出节点：逐行转换，不把概念整体读入内存
+        node_count = 0
+        with open(os.path.join(output_dir, "nodes.csv"), 'w', newline='', encoding='utf-8') as out:
+            writer = csv.DictWriter(out, fieldnames=self.neo4j_node_fields)
+            writer.writeheader()
+
+            # 首先添加预定义概念
+            for predefined_concept in self.predefined_concepts:
+                writer.writerow({
+                    "nodeId": predefined_concept["concept_id"],
+                    "labels": predefined_concept["concept_type"],
+                    "name": predefined_concept["name"],
+                    "preferredTerm": predefined_concept.get("preferred_term", ""),
+                    "fsn": predefined_concept.get("fsn", ""),
+                    "conceptType": predefined_concept["concept_type"],
+                    "synonyms": self._format_synonyms_for_neo4j(predefined_concept.get("synonyms", []))
                 })
-            elif concept["concept_type"] == "Ingredient":
-                node.update({
-                    "amount": concept.get("amount", ""),
-                    "unit": concept.get("unit", ""),
-                    "isMain": concept.get("is_main", "")
-                })
-            elif concept["concept_type"] == "CookingStep":
-                node.update({
-                    "description": concept.get("description", ""),
-                    "stepNumber": concept.get("step_number", ""),
-                    "methods": concept.get("methods", ""),
-                    "tools": concept.get("tools", ""),
-                    "timeEstimate": concept.get("time_estimate", "")
-                })
-
-            nodes_data.append(node)
-
-        # 导出节点
-        nodes_df = pd.DataFrame(nodes_data)
-        nodes_df.to_csv(os.path.join(output_dir, "nodes.csv"),
-                        index=False, encoding='utf-8')
-
-        # 准备关系数据
-        relationships_data = []
-        for rel in final_relationships:
-            relationship = {
-                "startNodeId": rel["source_id"],
-                "endNodeId": rel["target_id"],
-                "relationshipType": rel["relationship_type"],
-                "relationshipId": rel["relationship_id"]
-            }
-
-            # 添加额外属性
-            for key, value in rel.items():
-                if key not in ["source_id", "target_id", "relationship_type", "relationship_id"]:
-                    relationship[key] = value
-
-            relationships_data.append(relationship)
-
-        # 导出关系
-        relationships_df = pd.DataFrame(relationships_data)
-        relationships_df.to_csv(os.path.join(output_dir, "relationships.csv"),
-                                index=False, encoding='utf-8')
+                node_count += 1
+
+            # 然后添加动态生成的概念
+            with open(os.path.join(data_dir, "concepts.csv"), 'r', newline='', encoding='utf-8') as f:
+                for concept in csv.DictReader(f):
+                    node = {
+                        "nodeId": concept["concept_id"],
+                        "labels": concept["concept_type"],
+                        "name": concept["name"],
+                        "preferredTerm": concept.get("preferred_term", ""),
+                        "category": concept.get("category", ""),
+                        "conceptType": concept["concept_type"],
+                        "synonyms": self._format_synonyms_for_neo4j(concept.get("synonyms", ""))
+                    }
+
+                    # 添加特定类型的属性
+                    if concept["concept_type"] == "Recipe":
+                        node.update({
+                            "difficulty": concept.get("difficulty", ""),
+                            "cuisineType": concept.get("cuisine_type", ""),
+                            "prepTime": concept.get("prep_time", ""),
+                            "cookTime": concept.get("cook_time", ""),
+                            "servings": concept.get("servings", ""),
+                            "tags": concept.get("tags", ""),
+                            "filePath": concept.get("file_path", "")
+                        })
+                    elif concept["concept_type"] == "CookingStep":
+                        node.update({
+                            "description": concept.get("description", ""),
+                            "stepNumber": concept.get("step_number", ""),
+                            "methods": concept.get("methods", ""),
+                            "tools": concept.get("tools", ""),
+                            "timeEstimate": concept.get("time_estimate", "")
+                        })
+
+                    writer.writerow(node)
+                    node_count += 1
+
+        # 导出关系：合并数据和导出文件同名，先写临时文件再替换
+        relationship_count = 0
+        relationships_file = os.path.join(output_dir, "relationships.csv")
+        with open(relationships_file + ".tmp", 'w', newline='', encoding='utf-8') as out:
+            writer = csv.DictWriter(out, fieldnames=self.neo4j_relationship_fields, extrasaction='ignore')
+            writer.writeheader()
+            with open(os.path.join(data_dir, "relationships.csv"), 'r', newline='', encoding='utf-8') as f:
+                for rel in csv.DictReader(f):
+                    # 额外属性（用量、步骤顺序等）原样保留
+                    rel["startNodeId"] = rel.pop("source_id")
+                    rel["endNodeId"] = rel.pop("target_id")
+                    rel["relationshipType"] = rel.pop("relationship_type")
+                    rel["relationshipId"] = rel.pop("relationship_id")
+                    writer.writerow(rel)
+                    relationship_count += 1
+        os.replace(relationships_file + ".tmp", relationships_file)
 
         # 生成Neo4j导入脚本
         import_script = f"""
@@ -1001,9 +1714,6 @@ SET n.nodeId = row.nodeId,
     n.servings = row.servings,
     n.tags = row.tags,
     n.filePath = row.filePath,
-    n.amount = row.amount,
-    n.unit = row.unit,
-    n.isMain = toBoolean(row.isMain),
     n.description = row.description,
     n.stepNumber = toInteger(row.stepNumber),
     n.methods = row.methods,
@@ -1023,6 +1733,7 @@ CALL apoc.create.relationship(start, row.relationshipType, {{
     relationshipId: row.relationshipId,
     amount: row.amount,
     unit: row.unit,
+    isMain: toBoolean(row.is_main),
     stepOrder: toInteger(row.step_order)
 }}, end) YIELD rel
 RETURN count(rel);
@@ -1032,6 +1743,6 @@ RETURN count(rel);
             f.write(import_script)
 
         print(f"Neo4j CSV文件已导出到: {output_dir}")
-        print(f"- 节点数量: {len(nodes_data)}")
-        print(f"- 关系数量: {len(relationships_data)}")
+        print(f"- 节点数量: {node_count}")
+        print(f"- 关系数量: {relationship_count}")
 
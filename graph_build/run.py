@@ -1,11 +1,26 @@
+import logging
 import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 from graph_build.config import Config
 from graph_build.recipe_greap_gen import RecipeKnowledgeGraphBuilder, KimiRecipeParser
 
 config = Config()
 
+
+def setup_logging(level: str = config.log_level) -> QueueListener:
+    """配置日志：调用方只把记录放入队列，由后台线程负责输出，并发解析时不争抢输出锁"""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(log_queue, handler)
+    logging.basicConfig(level=level, handlers=[QueueHandler(log_queue)])
+    listener.start()
+    return listener
+
+
 def main():
     """主函数"""
     print("🍳 AI菜谱知识图谱生成器")
@@ -35,10 +50,12 @@ def main():
         print("取消处理")
         return
 
+    listener = setup_logging()
+    ai_agent = builder = None
     try:
         # 创建AI agent
         print("\n🤖 初始化AI Agent...")
-        ai_agent = KimiRecipeParser(api_key, config.base_url)
+        ai_agent = KimiRecipeParser(api_key, config.base_url, cache_path=config.cache_path)
 
         # 创建知识图谱构建器
         output_dir = config.output_dir
@@ -71,4 +88,11 @@ def main():
         print(f"\n\n⏹️  用户中断处理")
     except Exception as e:
         print(f"\n❌ 处理过程中出现错误: {str(e)}")
-        print(f"请检查API密钥、网络连接和菜谱文件格式")
\ No newline at end of file
+        print(f"请检查API密钥、网络连接和菜谱文件格式")
+    finally:
+        # 出错或中断时也要把缓冲中的CSV行写到磁盘并关闭文件和缓存
+        if builder is not None:
+            builder.close()
+        if ai_agent is not None:
+            ai_agent.close()
+        listener.stop()
\ No newline at end of file